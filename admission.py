@@ -0,0 +1,157 @@
+"""
+/analyze のアドミッション制御（同時実行数の制限・待ち行列・負荷制限）
+
+- 同時実行数はブラウザセッション数まで
+- 待ち行列は上限付き。満杯なら即座に拒否（429 + Retry-After）
+- 待ち時間に期限を設け、期限切れのリクエストも拒否
+- クライアントごとの待ち行列をラウンドロビンで処理し、特定ユーザーによる占有を防ぐ
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class AdmissionRejected(Exception):
+    """
+    リクエストを受け付けられない場合に送出
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.event = threading.Event()
+        self.slot = None
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=1, max_queue=2, max_queue_per_client=1,
+                 queue_timeout=60, initial_service_time=60):
+        """
+        max_concurrent: 同時に処理するリクエスト数（ブラウザセッション数）
+        max_queue: 待ち行列の最大長（全クライアント合計）
+        max_queue_per_client: 1クライアントあたりの待ち行列の最大長
+        queue_timeout: 待ち行列で待機できる最大秒数
+        initial_service_time: 処理時間の初期推定値（秒）
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+
+        self.lock = threading.Lock()
+        self.free_slots = list(range(max_concurrent))
+        self.queues = OrderedDict()  # client_id -> deque[_Waiter]
+        self.queued = 0
+
+        # 処理時間の指数移動平均（Retry-After の算出に使用）
+        self.service_time = float(initial_service_time)
+        self.smoothing = 0.2
+
+    def acquire(self, client_id):
+        """
+        処理スロットを取得して返す。受け付けられない場合は AdmissionRejected を送出
+        """
+        with self.lock:
+            if self.free_slots and not self.queued:
+                return self.free_slots.pop()
+
+            if self.queued >= self.max_queue:
+                raise AdmissionRejected('サーバーが混雑しています', self._retry_after_locked())
+
+            client_queue = self.queues.get(client_id)
+            if client_queue and len(client_queue) >= self.max_queue_per_client:
+                raise AdmissionRejected('同時に送信できるリクエスト数を超えています', self._retry_after_locked())
+
+            waiter = _Waiter(client_id)
+            self.queues.setdefault(client_id, deque()).append(waiter)
+            self.queued += 1
+
+        if waiter.event.wait(self.queue_timeout):
+            return waiter.slot
+
+        with self.lock:
+            # タイムアウトと同時にスロットが割り当てられた場合はそのまま処理する
+            if waiter.slot is not None:
+                return waiter.slot
+            self._remove_waiter_locked(waiter)
+            raise AdmissionRejected('待機時間が上限を超えました', self._retry_after_locked())
+
+    def release(self, slot, service_time=None):
+        """
+        処理スロットを返却し、待機中のリクエストがあれば次に割り当てる
+        """
+        with self.lock:
+            if service_time is not None:
+                self.service_time += self.smoothing * (service_time - self.service_time)
+
+            waiter = self._next_waiter_locked()
+            if waiter:
+                waiter.slot = slot
+                waiter.event.set()
+            else:
+                self.free_slots.append(slot)
+
+    def retry_after(self):
+        """
+        現在の混雑状況から推定した再試行までの秒数
+        """
+        with self.lock:
+            return self._retry_after_locked()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'active': self.max_concurrent - len(self.free_slots),
+                'queued': self.queued,
+                'avg_service_time': round(self.service_time, 1)
+            }
+
+    def _next_waiter_locked(self):
+        # クライアント単位のラウンドロビン
+        while self.queues:
+            client_id, client_queue = self.queues.popitem(last=False)
+            if not client_queue:
+                continue
+            waiter = client_queue.popleft()
+            if client_queue:
+                self.queues[client_id] = client_queue
+            self.queued -= 1
+            return waiter
+        return None
+
+    def _remove_waiter_locked(self, waiter):
+        client_queue = self.queues.get(waiter.client_id)
+        if client_queue and waiter in client_queue:
+            client_queue.remove(waiter)
+            self.queued -= 1
+            if not client_queue:
+                del self.queues[waiter.client_id]
+
+    def _retry_after_locked(self):
+        # 待機中のリクエストがすべて処理されるまでの推定秒数
+        rounds = (self.queued + 1) / self.max_concurrent
+        return max(1, math.ceil(self.service_time * rounds))
+
+
+class Admission:
+    """
+    with 文で使うためのヘルパー。処理時間を計測して返却時に記録する
+    """
+    def __init__(self, controller, client_id):
+        self.controller = controller
+        self.client_id = client_id
+        self.slot = None
+
+    def __enter__(self):
+        self.slot = self.controller.acquire(self.client_id)
+        self.started = time.monotonic()
+        return self.slot
+
+    def __exit__(self, *exc):
+        self.controller.release(self.slot, time.monotonic() - self.started)
@@ -1,7 +1,7 @@
 import os
-from datetime import datetime
 import statistics
 import re
+from models import Tweet, AccountInfo
 
 # AI APIクライアント
 try:
@@ -17,16 +17,34 @@ except ImportError:
     ANTHROPIC_AVAILABLE = False
 
 
+# AIによるスコア調整の上限（±）
+AI_SCORE_ADJUSTMENT_LIMIT = 20
+
+# 判定が切り替わるスコアの境界（フロントエンドの表示色: 40未満 / 40〜70 / 70以上）
+VERDICT_THRESHOLDS = (40, 70)
+
+
 class BotAnalyzer:
-    def __init__(self, api_key=None, api_type='auto'):
+    def __init__(self, api_key=None, api_type='auto', cascade=False,
+                 uncertainty_band=None, disagreement_threshold=50):
         """
         APIキーとタイプを指定してアナライザーを初期化
 
         api_type: 'gemini', 'claude', 'auto'（自動検出）
+        cascade: True の場合、ルールベースのスコアが判定に十分な時はAI分析を省略
+        uncertainty_band: AI分析を行う base_score の範囲 (下限, 上限)
+            None の場合、AI調整（±AI_SCORE_ADJUSTMENT_LIMIT）で判定の境界を
+            越えうるスコアのみAI分析を行う（既定の境界では 20〜90 に相当）
+        disagreement_threshold: 各項目スコアの最大差がこの値以上ならAI分析を行う
         """
         self.api_key = api_key
         self.api_type = api_type
         self.client = None
+        self.cascade = cascade
+        if uncertainty_band is not None and uncertainty_band[0] > uncertainty_band[1]:
+            raise ValueError(f'uncertainty_band の下限が上限を超えています: {uncertainty_band}')
+        self.uncertainty_band = uncertainty_band
+        self.disagreement_threshold = disagreement_threshold
 
         if not api_key:
             print('[ANALYZER] No API key provided. Rule-based analysis only.')
@@ -76,6 +94,31 @@ class BotAnalyzer:
             except Exception as e:
                 print(f'[ANALYZER] Claude initialization error: {e}')
 
+    @classmethod
+    def from_env(cls, environ=None):
+        """
+        環境変数からアナライザーを生成（APIサーバーとワーカーで共通）
+
+        GEMINI_API_KEY / CLAUDE_API_KEY（Geminiを優先）、ANALYZER_CASCADE、
+        CASCADE_BAND_LOW / CASCADE_BAND_HIGH（未設定時は自動）、CASCADE_DISAGREEMENT
+        """
+        environ = os.environ if environ is None else environ
+        api_key = environ.get('GEMINI_API_KEY', '') or environ.get('CLAUDE_API_KEY', '')
+
+        uncertainty_band = None
+        if 'CASCADE_BAND_LOW' in environ or 'CASCADE_BAND_HIGH' in environ:
+            uncertainty_band = (
+                float(environ.get('CASCADE_BAND_LOW', '0')),
+                float(environ.get('CASCADE_BAND_HIGH', '100'))
+            )
+
+        return cls(
+            api_key,
+            cascade=environ.get('ANALYZER_CASCADE', '').lower() in ('1', 'true', 'yes'),
+            uncertainty_band=uncertainty_band,
+            disagreement_threshold=float(environ.get('CASCADE_DISAGREEMENT', '50'))
+        )
+
     def analyze_tweets(self, tweets, account_info=None):
         """
         投稿データを分析してBOTスコアを算出
@@ -83,32 +126,41 @@ class BotAnalyzer:
         if not tweets:
             return self._create_error_result('投稿データがありません')
 
+        tweets = [Tweet.from_dict(t) for t in tweets]
+        account_info = AccountInfo.from_dict(account_info)
+
         # 1. ルールベース分析
         pattern_score = self._analyze_posting_pattern(tweets)
         text_score = self._analyze_text_naturalness(tweets)
         comm_score = self._analyze_communication(tweets)
         emotion_score = self._analyze_emotion_expression(tweets)
 
+        base_score = (
+            pattern_score * 0.25 +
+            text_score * 0.30 +
+            comm_score * 0.25 +
+            emotion_score * 0.20
+        )
+
         # 2. AI分析（APIが利用可能な場合）
         ai_summary = ''
         ai_score_adjustment = 0
 
-        if self.client:
+        if not self.client:
+            analysis_path = 'rule_based'
+            ai_summary = 'AI分析は利用できません。GEMINI_API_KEY または CLAUDE_API_KEY 環境変数を設定してください。'
+        elif self.cascade and not self._needs_ai_analysis(
+                base_score, [pattern_score, text_score, comm_score, emotion_score]):
+            # ルールベースのスコアで判定が確定しているためAI分析を省略
+            analysis_path = 'cascade_skip'
+            ai_summary = 'ルールベース分析の結果が明確なため、AI分析は省略されました。'
+        else:
+            analysis_path = 'ai'
             ai_result = self._ai_deep_analysis(tweets, account_info)
             ai_summary = ai_result['summary']
             ai_score_adjustment = ai_result['score_adjustment']
-        else:
-            ai_summary = 'AI分析は利用できません。GEMINI_API_KEY または CLAUDE_API_KEY 環境変数を設定してください。'
-
-        # 3. 総合スコア計算
-        base_score = (
-            pattern_score * 0.25 +
-            text_score * 0.30 +
-            comm_score * 0.25 +
-            emotion_score * 0.20
-        )
 
-        # AI調整を加える
+        # 3. 総合スコア計算（AI調整を加える）
         overall_score = max(0, min(100, base_score + ai_score_adjustment))
 
         return {
@@ -125,9 +177,33 @@ class BotAnalyzer:
                 'communication': self._get_comm_description(comm_score),
                 'emotion_expression': self._get_emotion_description(emotion_score)
             },
-            'ai_summary': ai_summary
+            'ai_summary': ai_summary,
+            'analysis_path': analysis_path
         }
 
+    def _needs_ai_analysis(self, base_score, scores):
+        """
+        カスケードモードでAI分析が必要か判定
+
+        base_score が不確実な範囲内にある場合、または各項目のスコアが
+        大きく食い違っている場合のみ True を返す
+        """
+        if self.uncertainty_band is None:
+            # AI調整の最小・最大でいずれかの境界の反対側に移りうるなら判定は未確定
+            lowest = base_score - AI_SCORE_ADJUSTMENT_LIMIT
+            highest = base_score + AI_SCORE_ADJUSTMENT_LIMIT
+            if any((lowest >= threshold) != (highest >= threshold) for threshold in VERDICT_THRESHOLDS):
+                return True
+        else:
+            low, high = self.uncertainty_band
+            if low <= base_score <= high:
+                return True
+
+        if max(scores) - min(scores) >= self.disagreement_threshold:
+            return True
+
+        return False
+
     def _analyze_posting_pattern(self, tweets):
         """
         投稿パターンを分析（時間間隔の規則性）
@@ -137,10 +213,12 @@ class BotAnalyzer:
 
         try:
             # 投稿時間間隔を計算
+            timestamps = [t.timestamp for t in tweets]
+            if None in timestamps:
+                raise ValueError('投稿日時を解析できません')
+
             intervals = []
-            for i in range(len(tweets) - 1):
-                time1 = datetime.fromisoformat(tweets[i]['date'].replace('Z', '+00:00'))
-                time2 = datetime.fromisoformat(tweets[i+1]['date'].replace('Z', '+00:00'))
+            for time1, time2 in zip(timestamps, timestamps[1:]):
                 interval = abs((time1 - time2).total_seconds() / 3600)  # 時間単位
                 intervals.append(interval)
 
@@ -161,8 +239,7 @@ class BotAnalyzer:
 
             # 深夜・早朝投稿をチェック（人間は睡眠時間に投稿が少ない）
             night_posts = 0
-            for tweet in tweets:
-                time = datetime.fromisoformat(tweet['date'].replace('Z', '+00:00'))
+            for time in timestamps:
                 hour = time.hour
                 if 2 <= hour <= 6:  # 深夜2時〜6時
                     night_posts += 1
@@ -182,7 +259,7 @@ class BotAnalyzer:
         文章の自然さを分析
         """
         try:
-            texts = [t['text'] for t in tweets if t['text']]
+            texts = [t.text for t in tweets if t.text]
             if not texts:
                 return 50
 
@@ -221,7 +298,7 @@ class BotAnalyzer:
         コミュニケーション性を分析（返信・引用・リツイートなど）
         """
         try:
-            texts = [t['text'] for t in tweets]
+            texts = [t.text for t in tweets]
 
             # @メンションの数
             mention_count = sum([t.count('@') for t in texts])
@@ -252,7 +329,7 @@ class BotAnalyzer:
         感情表現の多様性を分析
         """
         try:
-            texts = [t['text'] for t in tweets]
+            texts = [t.text for t in tweets]
 
             # 絵文字・顔文字
             emoji_pattern = r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]'
@@ -296,13 +373,13 @@ class BotAnalyzer:
         try:
             # 投稿サンプルを準備（最新20件）
             sample_tweets = tweets[:20]
-            tweet_texts = '\n'.join([f"- {t['text']}" for t in sample_tweets])
+            tweet_texts = '\n'.join([f"- {t.text}" for t in sample_tweets])
 
             prompt = f"""以下のX（Twitter）アカウントの投稿を分析し、このアカウントが人間によって運用されているか、BOTによって運用されているかを判定してください。
 
 アカウント情報:
-- 名前: {account_info.get('name', 'Unknown') if account_info else 'Unknown'}
-- ユーザー名: @{account_info.get('username', 'unknown') if account_info else 'unknown'}
+- 名前: {account_info.name}
+- ユーザー名: @{account_info.username}
 
 投稿サンプル（最新20件）:
 {tweet_texts}
@@ -346,7 +423,7 @@ class BotAnalyzer:
             score_adjustment = int(score_match.group(1)) if score_match else 0
 
             # スコア調整を-20〜+20に制限
-            score_adjustment = max(-20, min(20, score_adjustment))
+            score_adjustment = max(-AI_SCORE_ADJUSTMENT_LIMIT, min(AI_SCORE_ADJUSTMENT_LIMIT, score_adjustment))
 
             return {
                 'summary': summary,
@@ -409,7 +486,8 @@ class BotAnalyzer:
                 'communication': message,
                 'emotion_expression': message
             },
-            'ai_summary': message
+            'ai_summary': message,
+            'analysis_path': 'error'
         }
 
     def is_ready(self):
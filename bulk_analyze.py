@@ -0,0 +1,380 @@
+"""
+エクスポート済みの投稿データ（JSONL / CSV）をオフラインで一括分析するCLI
+
+入力はアカウントごとにまとまって（連続して）並んでいる必要があります。
+アカウント単位でストリーミング処理するため、投稿数に関わらずメモリ使用量は一定です。
+ただし再開時は分析済みアカウント名を保持するため、その分はアカウント数に比例して増えます。
+
+使用例:
+    python bulk_analyze.py tweets.jsonl -o results.jsonl
+    python bulk_analyze.py tweets.csv -o results.parquet --format parquet --workers 8
+    python bulk_analyze.py tweets.jsonl -o results.jsonl --ai --ai-rate 30
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from itertools import groupby, islice
+from multiprocessing import Pool
+
+from analyzer import BotAnalyzer
+from models import Tweet, AccountInfo
+
+# Parquet出力（オプション）
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+if PYARROW_AVAILABLE:
+    PARQUET_SCHEMA = pa.schema([
+        ('username', pa.string()),
+        ('tweet_count', pa.int64()),
+        ('overall_score', pa.float64()),
+        ('posting_pattern', pa.float64()),
+        ('text_naturalness', pa.float64()),
+        ('communication', pa.float64()),
+        ('emotion_expression', pa.float64()),
+        ('analysis_path', pa.string()),
+        ('ai_summary', pa.string())
+    ])
+
+
+# ワーカープロセスごとのアナライザー（Pool の initializer で設定）
+_worker_analyzer = None
+
+
+class RateLimiter:
+    """
+    1分あたりの呼び出し回数を制限する簡易レートリミッター
+    """
+    def __init__(self, calls_per_minute):
+        self.interval = 60.0 / calls_per_minute if calls_per_minute > 0 else 0
+        self.last_call = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.last_call + self.interval - now
+            if delay > 0:
+                time.sleep(delay)
+            self.last_call = time.monotonic()
+
+
+class RateLimitedAnalyzer(BotAnalyzer):
+    """
+    AI呼び出しにレート制限をかけたアナライザー
+    """
+    def __init__(self, *args, calls_per_minute=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = RateLimiter(calls_per_minute)
+
+    def _ai_deep_analysis(self, tweets, account_info):
+        self.rate_limiter.wait()
+        return super()._ai_deep_analysis(tweets, account_info)
+
+
+def _init_worker(api_key, cascade, calls_per_minute):
+    global _worker_analyzer
+    if api_key:
+        _worker_analyzer = RateLimitedAnalyzer(
+            api_key, cascade=cascade, calls_per_minute=calls_per_minute
+        )
+    else:
+        _worker_analyzer = BotAnalyzer()
+
+
+def _analyze_account(task):
+    """
+    1アカウント分の投稿を分析（ワーカープロセスで実行）
+    """
+    username, records = task
+    tweets = [Tweet(text, date) for text, date in records]
+    try:
+        result = _worker_analyzer.analyze_tweets(tweets, AccountInfo(username=username))
+    except Exception as e:
+        print(f'[BULK] Analysis error for @{username}: {e}')
+        result = _worker_analyzer._create_error_result(f'分析中にエラーが発生しました: {e}')
+    return username, len(tweets), result
+
+
+def read_records(path, input_format):
+    """
+    入力ファイルから1行ずつレコードを読み出す
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        if input_format == 'csv':
+            yield from csv.DictReader(f)
+            return
+
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f'[BULK] Skipping invalid JSON at line {line_no}: {e}')
+                continue
+
+            if not isinstance(record, dict):
+                print(f'[BULK] Skipping non-object JSON at line {line_no}: {type(record).__name__}')
+                continue
+            yield record
+
+
+def iter_accounts(records, user_field, text_field, date_field, max_tweets, completed):
+    """
+    連続するレコードをアカウント単位にまとめて (username, tweets) を返す
+    """
+    for username, group in groupby(records, key=lambda r: (r.get(user_field) or '').lstrip('@')):
+        if not username or username in completed:
+            # groupby の残りは次のキーに進む際に読み捨てられる
+            continue
+
+        tweets = []
+        for record in islice(group, max_tweets):
+            # 日時のパースはワーカー側で行うため、ここでは (text, date) のみ保持
+            tweets.append((record.get(text_field), record.get(date_field)))
+        yield username, tweets
+
+
+def _flatten_result(username, tweet_count, result):
+    scores = result['detailed_scores']
+    return {
+        'username': username,
+        'tweet_count': tweet_count,
+        'overall_score': result['overall_score'],
+        'posting_pattern': scores['posting_pattern'],
+        'text_naturalness': scores['text_naturalness'],
+        'communication': scores['communication'],
+        'emotion_expression': scores['emotion_expression'],
+        'analysis_path': result.get('analysis_path', ''),
+        'ai_summary': result.get('ai_summary', '')
+    }
+
+
+class JsonlWriter:
+    """
+    結果をJSONLファイルへ追記
+    """
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.resume = resume
+
+    def load_completed(self):
+        completed = set()
+        if not os.path.exists(self.path):
+            return completed
+
+        self._truncate_partial_line()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    completed.add(json.loads(line)['username'])
+                except (json.JSONDecodeError, KeyError):
+                    # 中断時に書きかけになった行は無視
+                    continue
+        return completed
+
+    def _truncate_partial_line(self):
+        """
+        中断時に書きかけになった末尾の行を削除し、追記が壊れた行に連結されないようにする
+        """
+        with open(self.path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                step = min(65536, position)
+                position -= step
+                f.seek(position)
+                chunk = f.read(step)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    position += newline + 1
+                    break
+
+            if position < end:
+                print(f'[BULK] Removing partial line at end of {self.path} ({end - position} bytes)')
+                f.truncate(position)
+
+    def __enter__(self):
+        self.file = open(self.path, 'a' if self.resume else 'w', encoding='utf-8')
+        return self
+
+    def write(self, row):
+        self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+class ParquetWriter:
+    """
+    結果をParquetファイル群としてディレクトリに出力
+
+    Parquetは追記できないため、フラッシュのたびにバッファを独立したパートファイルとして
+    書き出します。一時ファイルに書いてから名前を変更するため、中断しても
+    書き出し済みのパートは読める状態で残ります。
+    """
+    def __init__(self, path, resume=True, buffer_size=1000):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError('Parquet出力には pyarrow が必要です（pip install pyarrow）')
+        self.path = path
+        self.resume = resume
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def _part_files(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if name.endswith('.parquet')
+        )
+
+    def load_completed(self):
+        completed = set()
+        for part in self._part_files():
+            try:
+                table = pq.read_table(part, columns=['username'])
+            except Exception as e:
+                # 中断によりフッターが書かれていないパートは読めないため退避して再分析する
+                print(f'[BULK] Moving aside unreadable part {part}: {e}')
+                os.replace(part, part + '.corrupt')
+                continue
+            completed.update(table.column('username').to_pylist())
+        return completed
+
+    def __enter__(self):
+        os.makedirs(self.path, exist_ok=True)
+        if not self.resume:
+            for part in self._part_files():
+                os.remove(part)
+
+        # 中断により名前の変更前に残った一時ファイルを削除
+        for name in os.listdir(self.path):
+            if name.endswith('.parquet.tmp'):
+                os.remove(os.path.join(self.path, name))
+        return self
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        table = pa.Table.from_pylist(self.buffer, schema=PARQUET_SCHEMA)
+        # 既存のパート（退避済みのものを含む）と名前が重ならないよう時刻から命名
+        part_path = os.path.join(self.path, f'part-{time.time_ns()}.parquet')
+        pq.write_table(table, part_path + '.tmp')
+        os.replace(part_path + '.tmp', part_path)
+        self.buffer = []
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def run(args):
+    input_format = args.input_format
+    if input_format == 'auto':
+        input_format = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+
+    if args.format == 'parquet':
+        writer = ParquetWriter(args.output, resume=args.resume)
+    else:
+        writer = JsonlWriter(args.output, resume=args.resume)
+
+    completed = writer.load_completed() if args.resume else set()
+    if completed:
+        print(f'[BULK] Resuming: {len(completed)} accounts already analyzed')
+
+    api_key = ''
+    if args.ai:
+        api_key = os.environ.get('GEMINI_API_KEY', '') or os.environ.get('CLAUDE_API_KEY', '')
+        if not api_key:
+            print('[BULK WARNING] --ai specified but no API key set. Rule-based analysis only.')
+
+    # レート制限は全ワーカーで分け合う
+    calls_per_minute = args.ai_rate / args.workers if args.ai_rate else 0
+
+    accounts = iter_accounts(
+        read_records(args.input, input_format),
+        args.user_field, args.text_field, args.date_field,
+        args.max_tweets, completed
+    )
+
+    # 処理中のアカウント数を制限し、入力を一度に取り込まないようにする
+    # （バッチ単位で待ち合わせないため、遅いアカウントがあっても他のワーカーは止まらない）
+    max_in_flight = args.workers * args.chunksize * 4
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def throttled(items):
+        for item in items:
+            in_flight.acquire()
+            yield item
+
+    processed = 0
+    started = time.monotonic()
+
+    with writer, Pool(args.workers, initializer=_init_worker,
+                      initargs=(api_key, args.cascade, calls_per_minute)) as pool:
+        for username, tweet_count, result in pool.imap_unordered(
+                _analyze_account, throttled(accounts), chunksize=args.chunksize):
+            writer.write(_flatten_result(username, tweet_count, result))
+            in_flight.release()
+            processed += 1
+
+            if processed % max_in_flight == 0:
+                writer.flush()
+                elapsed = time.monotonic() - started
+                print(f'[BULK] Progress: {processed} accounts ({processed / elapsed:.1f}/s)')
+
+        writer.flush()
+
+    print(f'[BULK] Done. {processed} accounts written to {args.output}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='投稿データを一括でBOT判定します')
+    parser.add_argument('input', help='入力ファイル（JSONL または CSV、アカウントごとに連続して並べる）')
+    parser.add_argument('-o', '--output', required=True, help='出力先（JSONLファイル または Parquetディレクトリ）')
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl', help='出力形式')
+    parser.add_argument('--input-format', choices=['auto', 'jsonl', 'csv'], default='auto', help='入力形式')
+    parser.add_argument('--user-field', default='username', help='ユーザー名のフィールド名')
+    parser.add_argument('--text-field', default='text', help='投稿本文のフィールド名')
+    parser.add_argument('--date-field', default='date', help='投稿日時（ISO 8601）のフィールド名')
+    parser.add_argument('--max-tweets', type=int, default=200, help='1アカウントあたりの最大投稿数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='ワーカープロセス数')
+    parser.add_argument('--chunksize', type=int, default=16, help='1回にワーカーへ渡すアカウント数')
+    parser.add_argument('--no-resume', dest='resume', action='store_false', help='既存の出力を無視して最初から分析')
+    parser.add_argument('--ai', action='store_true', help='AI分析を有効化（GEMINI_API_KEY / CLAUDE_API_KEY を使用）')
+    parser.add_argument('--ai-rate', type=float, default=60, help='AI呼び出しの上限（回/分、全ワーカー合計）')
+    parser.add_argument('--cascade', action='store_true', help='ルールベースのスコアが明確な場合はAI分析を省略')
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error('--workers は1以上を指定してください')
+    if args.chunksize < 1:
+        parser.error('--chunksize は1以上を指定してください')
+    if args.max_tweets < 1:
+        parser.error('--max-tweets は1以上を指定してください')
+    return args
+
+
+if __name__ == '__main__':
+    run(parse_args())
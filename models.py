@@ -0,0 +1,71 @@
+"""
+投稿・アカウント情報のレコード
+
+スクレイパー・アナライザー・サーバー間で受け渡すデータを __slots__ 付きのクラスで保持し、
+日時のパースなどの派生値は生成時に一度だけ計算します。
+"""
+from datetime import datetime
+
+
+def parse_datetime(value):
+    """
+    ISO 8601 形式の文字列を datetime に変換（失敗時は None）
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class Tweet:
+    __slots__ = ('text', 'date', 'timestamp')
+
+    def __init__(self, text, date):
+        self.text = text or ''
+        self.date = date or ''
+        self.timestamp = parse_datetime(self.date)
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        return cls(data.get('text'), data.get('date'))
+
+    def to_dict(self):
+        return {'text': self.text, 'date': self.date}
+
+    def __repr__(self):
+        return f'Tweet(text={self.text[:20]!r}, date={self.date!r})'
+
+
+class AccountInfo:
+    __slots__ = ('name', 'username', 'profile_image')
+
+    def __init__(self, name='Unknown', username='unknown', profile_image=None):
+        self.name = name
+        self.username = username
+        self.profile_image = profile_image
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        if not data:
+            return cls()
+        return cls(
+            data.get('name', 'Unknown'),
+            data.get('username', 'unknown'),
+            data.get('profile_image')
+        )
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'username': self.username,
+            'profile_image': self.profile_image
+        }
+
+    def __repr__(self):
+        return f'AccountInfo(name={self.name!r}, username={self.username!r})'
@@ -0,0 +1,155 @@
+"""
+本番環境向けの低負荷サンプリングプロファイラー
+
+プロファイル対象のリクエストを処理しているスレッドのスタックを一定間隔で取得し、
+collapsed stack 形式（flamegraph.pl / speedscope 互換）で集計します。
+対象スレッドがない間はサンプリング用スレッドも停止するため、負荷はかかりません。
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01, sample_rate=0.0, max_stacks=10000, max_depth=64):
+        """
+        interval: スタックを取得する間隔（秒）
+        sample_rate: プロファイル対象とするリクエストの割合（0.0〜1.0）
+        max_stacks: 保持するスタックの種類の上限（超えた分は [truncated] に集計）
+        max_depth: 記録するスタックの深さの上限（根元側を残し、切り詰めた位置に [truncated] を付ける）
+        """
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.active = {}  # thread_id -> label
+        self.sampler = None
+        self.samples = 0
+        self.profiled_requests = 0
+        self.started_at = time.time()
+
+    def should_profile(self, forced=False):
+        """
+        このリクエストをプロファイル対象にするか判定
+        """
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    @contextmanager
+    def profile(self, label):
+        """
+        with ブロック内の現在のスレッドをサンプリング対象にする
+        """
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.active[thread_id] = label
+            self.profiled_requests += 1
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self.sampler.start()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.active:
+                    self.sampler = None
+                    return
+                targets = dict(self.active)
+
+            frames = sys._current_frames()
+            collected = []
+            for thread_id, label in targets.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    collected.append(self._collapse(frame, label))
+            del frames
+
+            with self.lock:
+                for stack in collected:
+                    if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                        stack = '[truncated]'
+                    self.stacks[stack] += 1
+                    self.samples += 1
+
+            time.sleep(self.interval)
+
+    def _collapse(self, frame, label):
+        frames = []
+        while frame is not None:
+            frames.append(frame.f_code)
+            frame = frame.f_back
+        frames.reverse()
+
+        # 根元側を残して深すぎる部分を切り詰め、同じ呼び出し経路が同じ位置に集計されるようにする
+        truncated = len(frames) > self.max_depth
+        names = [label]
+        for code in frames[:self.max_depth]:
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        if truncated:
+            names.append('[truncated]')
+        return ';'.join(name.replace(';', ':') for name in names)
+
+    def collapsed(self):
+        """
+        collapsed stack 形式のテキストを返す（1行 = "frame;frame;... count"）
+        """
+        with self.lock:
+            items = sorted(self.stacks.items())
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+
+    def tree(self):
+        """
+        d3-flame-graph 形式のツリーを返す
+        """
+        root = {'name': 'root', 'value': 0, 'children': {}}
+        with self.lock:
+            items = list(self.stacks.items())
+
+        for stack, count in items:
+            node = root
+            node['value'] += count
+            for name in stack.split(';'):
+                child = node['children'].get(name)
+                if child is None:
+                    child = node['children'][name] = {'name': name, 'value': 0, 'children': {}}
+                child['value'] += count
+                node = child
+
+        def to_list(node):
+            return {
+                'name': node['name'],
+                'value': node['value'],
+                'children': [to_list(child) for child in node['children'].values()]
+            }
+
+        return to_list(root)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'interval': self.interval,
+                'sample_rate': self.sample_rate,
+                'samples': self.samples,
+                'unique_stacks': len(self.stacks),
+                'profiled_requests': self.profiled_requests,
+                'active': len(self.active),
+                'since': self.started_at
+            }
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.profiled_requests = 0
+            self.started_at = time.time()
@@ -0,0 +1,108 @@
+"""
+JSONレスポンスの生成
+
+- orjson が利用可能なら高速にエンコード（なければ標準の json）
+- ?fields=analysis,account.username のようなフィールド指定で必要な項目だけ返す
+- Accept-Encoding に応じて brotli / gzip で圧縮
+- GET リクエストには ETag を付与し、If-None-Match が一致すれば 304 を返す
+"""
+import gzip
+import hashlib
+import json
+
+from flask import request, Response
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# これより小さいレスポンスは圧縮しない
+COMPRESS_MIN_SIZE = 1024
+
+
+def dumps(payload):
+    """
+    JSONをUTF-8のバイト列にエンコード
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def project(payload, fields):
+    """
+    指定されたフィールドだけを残す（"analysis.overall_score" のようにドット区切りで階層を指定）
+    """
+    if not fields or not isinstance(payload, dict):
+        return payload
+
+    projected = {}
+    for field in fields.split(','):
+        path = [key for key in field.strip().split('.') if key]
+        if not path:
+            continue
+
+        source = payload
+        for key in path:
+            if not isinstance(source, dict) or key not in source:
+                break
+            source = source[key]
+        else:
+            target = projected
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = source
+
+    return projected
+
+
+def _negotiate_encoding():
+    accepted = request.headers.get('Accept-Encoding', '')
+    encodings = {part.split(';')[0].strip().lower() for part in accepted.split(',')}
+    if BROTLI_AVAILABLE and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+
+def json_response(payload, status=200, headers=None):
+    """
+    フィールド指定・圧縮・ETag に対応したJSONレスポンスを返す
+    （フィールド指定は完了した結果（200）にのみ適用し、202 のジョブ状態などはそのまま返す）
+    """
+    if status == 200:
+        payload = project(payload, request.args.get('fields'))
+    body = dumps(payload)
+    response_headers = {'Vary': 'Accept-Encoding'}
+    response_headers.update(headers or {})
+
+    if request.method == 'GET' and status == 200:
+        # 圧縮前の内容から算出するため、エンコーディングに依存しない弱いETagとする
+        etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+        response_headers['ETag'] = etag
+        response_headers['Cache-Control'] = 'no-cache'
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        if etag in candidates or etag[2:] in candidates or '*' in candidates:
+            return Response(status=304, headers=response_headers)
+
+    if len(body) >= COMPRESS_MIN_SIZE:
+        encoding = _negotiate_encoding()
+        if encoding == 'br':
+            body = brotli.compress(body, quality=5)
+            response_headers['Content-Encoding'] = 'br'
+        elif encoding == 'gzip':
+            body = gzip.compress(body, compresslevel=6)
+            response_headers['Content-Encoding'] = 'gzip'
+
+    return Response(body, status=status, headers=response_headers, mimetype='application/json')
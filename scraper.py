@@ -7,6 +7,7 @@ from selenium.webdriver.chrome.service import Service
 import time
 import json
 from datetime import datetime
+from models import Tweet, AccountInfo
 
 class TwitterScraper:
     def __init__(self, headless=True):
@@ -112,21 +113,18 @@ class TwitterScraper:
             except:
                 username = 'unknown'
 
-            return {
-                'name': name,
-                'username': username,
-                'profile_image': profile_img
-            }
+            return AccountInfo(name, username, profile_img)
 
         except Exception as e:
             print(f'[SCRAPER] Error extracting account info: {e}')
-            return {}
+            return AccountInfo()
 
     def _extract_tweets(self, max_tweets=50):
         """
         投稿を抽出
         """
         tweets = []
+        seen_texts = set()
         last_height = 0
         scroll_attempts = 0
         max_scroll_attempts = 20
@@ -182,11 +180,9 @@ class TwitterScraper:
                             date = datetime.now().isoformat()
 
                         # 重複チェック
-                        if not any(t['text'] == text for t in tweets):
-                            tweets.append({
-                                'text': text,
-                                'date': date
-                            })
+                        if text not in seen_texts:
+                            seen_texts.add(text)
+                            tweets.append(Tweet(text, date))
                             print(f'[SCRAPER] Tweet #{len(tweets)}: {text[:50]}...')
 
                     except Exception as e:
@@ -36,7 +36,13 @@ async function analyzeAccount() {
             throw new Error(error.error || '分析に失敗しました');
         }
 
-        const data = await response.json();
+        let data = await response.json();
+
+        // 分散モードで時間内に完了しなかった場合は 202 とジョブIDが返るため、結果をポーリング
+        if (response.status === 202) {
+            data = await waitForJob(data.job_id);
+        }
+
         currentAnalysis = data;
         showResults(data);
 
@@ -46,6 +52,24 @@ async function analyzeAccount() {
     }
 }
 
+async function waitForJob(jobId) {
+    // 最大10分間待機
+    for (let attempt = 0; attempt < 200; attempt++) {
+        await new Promise(resolve => setTimeout(resolve, 3000));
+
+        const response = await fetch(`${API_URL}/jobs/${jobId}`);
+        const data = await response.json();
+
+        if (!response.ok) {
+            throw new Error(data.error || '分析に失敗しました');
+        }
+        if (response.status !== 202) {
+            return data;
+        }
+    }
+    throw new Error('分析がタイムアウトしました。しばらくしてから再度お試しください。');
+}
+
 function isValidTwitterUrl(url) {
     const patterns = [
         /^https?:\/\/(www\.)?(twitter\.com|x\.com)\/[a-zA-Z0-9_]+\/?$/,
@@ -1,8 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
 from scraper import TwitterScraper
 from analyzer import BotAnalyzer
+from admission import AdmissionController, Admission, AdmissionRejected
+from task_queue import create_broker
+from profiler import SamplingProfiler
+from responses import json_response
+from functools import wraps
+import hmac
+import time
+from urllib.parse import urlencode
 
 app = Flask(__name__)
 
@@ -11,21 +19,99 @@ CORS(app, resources={
     r"/*": {
         "origins": "*",
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
-        "expose_headers": ["Content-Type"],
+        "allow_headers": ["Content-Type", "Authorization", "X-Profile", "If-None-Match"],
+        "expose_headers": ["Content-Type", "Retry-After", "ETag"],
         "max_age": 3600
     }
 })
 
 # AI API Keyの設定（Geminiを優先）
+# アナライザーの設定（APIキー・カスケードモード）は BotAnalyzer.from_env() で読み込む
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 CLAUDE_API_KEY = os.environ.get('CLAUDE_API_KEY', '')
 
-# どちらかのAPIキーを使用（Geminiを優先）
-API_KEY = GEMINI_API_KEY or CLAUDE_API_KEY
+# アドミッション制御：同時実行数はブラウザセッション数まで
+BROWSER_SESSIONS = int(os.environ.get('BROWSER_SESSIONS', '1'))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '2'))
+ADMISSION_MAX_QUEUE_PER_CLIENT = int(os.environ.get('ADMISSION_MAX_QUEUE_PER_CLIENT', '1'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '60'))
 
-scraper = TwitterScraper()
-analyzer = BotAnalyzer(API_KEY)
+# クライアントIPの判定に信頼するプロキシ
+# Fly.io 上（FLY_APP_NAME が設定される）では Fly-Client-IP をプロキシが上書きするため信頼できる
+TRUST_FLY_CLIENT_IP = bool(os.environ.get('FLY_APP_NAME'))
+# X-Forwarded-For を追記する信頼済みプロキシの段数（0なら X-Forwarded-For は使わない）
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+
+# 分散モード：設定されている場合、スクレイピングと分析はワーカー（worker.py）で実行
+TASK_BROKER_URL = os.environ.get('TASK_BROKER_URL', '')
+JOB_WAIT_TIMEOUT = float(os.environ.get('JOB_WAIT_TIMEOUT', '280'))
+# gunicorn のスレッド数（Dockerfile の WEB_THREADS と合わせる）
+WEB_THREADS = int(os.environ.get('WEB_THREADS', '4'))
+# ヘルスチェック・429応答のために空けておくスレッド数
+RESERVED_THREADS = 1
+# 結果を待機する /analyze の同時実行数。待機中はスレッドを占有するため、
+# 既定では待ち行列とヘルスチェック用を除いた残りのスレッドをすべて使う
+JOB_MAX_WAITING = int(os.environ.get(
+    'JOB_MAX_WAITING',
+    str(max(1, WEB_THREADS - ADMISSION_MAX_QUEUE - RESERVED_THREADS))
+))
+# 取得待ちのスクレイピングタスク数の上限（超えた場合は 429）
+MAX_PENDING_JOBS = int(os.environ.get('MAX_PENDING_JOBS', '50'))
+
+if TASK_BROKER_URL.startswith('memory://'):
+    # memory:// はプロセス内のワーカーからしか取得されず、APIサーバー単体ではジョブが完了しない
+    raise ValueError('TASK_BROKER_URL に memory:// は使用できません（sqlite:/// または redis:// を指定してください）')
+broker = create_broker(TASK_BROKER_URL) if TASK_BROKER_URL else None
+
+# ブラウザセッションごとにスクレイパーを用意（スロット番号で割り当て）
+scrapers = [TwitterScraper() for _ in range(BROWSER_SESSIONS)]
+scraper = scrapers[0]
+admission = AdmissionController(
+    max_concurrent=JOB_MAX_WAITING if broker else BROWSER_SESSIONS,
+    max_queue=ADMISSION_MAX_QUEUE,
+    max_queue_per_client=ADMISSION_MAX_QUEUE_PER_CLIENT,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT
+)
+analyzer = BotAnalyzer.from_env()
+
+# サンプリングプロファイラー：一部のリクエスト、または X-Profile ヘッダー付きのリクエストを計測
+# ADMIN_TOKEN は /admin 用、PROFILE_TOKEN はブラウザなどから計測を指定するための別トークン
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+if PROFILE_TOKEN and PROFILE_TOKEN == ADMIN_TOKEN:
+    print('[WARN] PROFILE_TOKEN is the same as ADMIN_TOKEN; use a separate value')
+profiler = SamplingProfiler(
+    interval=float(os.environ.get('PROFILE_INTERVAL', '0.01')),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+)
+
+def profiled(label):
+    """
+    対象リクエストの処理中、そのスレッドのスタックをサンプリングするデコレーター
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # X-Profile: <PROFILE_TOKEN>、または管理者の Authorization ヘッダー付きの X-Profile で計測を指定
+            trigger = request.headers.get('X-Profile', '')
+            forced = bool(trigger) and (token_matches(trigger, PROFILE_TOKEN) or is_admin())
+            if not profiler.should_profile(forced):
+                return view(*args, **kwargs)
+            with profiler.profile(label):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def token_matches(value, expected):
+    """
+    タイミング攻撃を防ぐため定数時間で比較（トークン未設定時は常に False）
+    """
+    if not expected:
+        return False
+    return hmac.compare_digest(value.encode('utf-8'), expected.encode('utf-8'))
+
+def is_admin():
+    return token_matches(request.headers.get('Authorization', ''), f'Bearer {ADMIN_TOKEN}' if ADMIN_TOKEN else '')
 
 @app.route('/')
 def index():
@@ -35,6 +121,7 @@ def index():
     })
 
 @app.route('/analyze', methods=['POST'])
+@profiled('analyze')
 def analyze_account():
     """
     XアカウントURLを受け取り、BOT判定結果を返す
@@ -53,33 +140,44 @@ def analyze_account():
 
         print(f'[INFO] Analyzing account: @{username}')
 
-        # 1. アカウント情報と投稿を取得
-        print('[INFO] Scraping tweets...')
-        account_data = scraper.scrape_account(username)
+        if broker:
+            return enqueue_analysis(username, get_client_id(), wait=not data.get('async'))
+
+        with Admission(admission, get_client_id()) as slot:
+            # 1. アカウント情報と投稿を取得
+            print('[INFO] Scraping tweets...')
+            account_data = scrapers[slot].scrape_account(username)
 
-        if not account_data or not account_data.get('tweets'):
-            return jsonify({
-                'error': '投稿データを取得できませんでした。アカウントが存在しないか、非公開の可能性があります。'
-            }), 404
+            if not account_data or not account_data.get('tweets'):
+                return jsonify({
+                    'error': '投稿データを取得できませんでした。アカウントが存在しないか、非公開の可能性があります。'
+                }), 404
 
-        print(f'[INFO] Found {len(account_data["tweets"])} tweets')
+            print(f'[INFO] Found {len(account_data["tweets"])} tweets')
 
-        # 2. AI分析実行
-        print('[INFO] Analyzing with AI...')
-        analysis_result = analyzer.analyze_tweets(
-            account_data['tweets'],
-            account_data.get('account_info', {})
-        )
+            # 2. AI分析実行
+            print('[INFO] Analyzing with AI...')
+            analysis_result = analyzer.analyze_tweets(
+                account_data['tweets'],
+                account_data['account_info']
+            )
 
         # 3. 結果を返す
         response = {
-            'account': account_data.get('account_info', {}),
-            'tweets': account_data['tweets'][:10],  # 最初の10件のみ返す
+            'account': account_data['account_info'].to_dict(),
+            'tweets': [t.to_dict() for t in account_data['tweets'][:10]],  # 最初の10件のみ返す
             'analysis': analysis_result
         }
 
-        print(f'[INFO] Analysis complete. Score: {analysis_result["overall_score"]}%')
-        return jsonify(response)
+        print(f'[INFO] Analysis complete. Score: {analysis_result["overall_score"]}% (path: {analysis_result["analysis_path"]})')
+        return json_response(response)
+
+    except AdmissionRejected as e:
+        print(f'[INFO] Request rejected: {e} (retry after {e.retry_after}s)')
+        return jsonify({
+            'error': f'{e}。{e.retry_after}秒後に再度お試しください。',
+            'retry_after': e.retry_after
+        }), 429, {'Retry-After': str(e.retry_after)}
 
     except Exception as e:
         print(f'[ERROR] {str(e)}')
@@ -89,6 +187,85 @@ def analyze_account():
             'error': f'分析中にエラーが発生しました: {str(e)}'
         }), 500
 
+def enqueue_analysis(username, client_id, wait=True):
+    """
+    分散モード：スクレイピングタスクを登録し、完了まで待機（または即座にジョブIDを返す）
+
+    待機するリクエストはスレッドを占有するため、ローカルモードと同じアドミッション制御を通す
+    """
+    if not wait:
+        job_id = submit_job(username)
+        return job_response(job_id, {'status': 'pending', 'result': None})
+
+    with Admission(admission, client_id):
+        job_id = submit_job(username)
+        deadline = time.monotonic() + JOB_WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            job = broker.get_result(job_id)
+            if job and job['status'] != 'pending':
+                return job_response(job_id, job)
+            time.sleep(0.5)
+
+    return job_response(job_id, {'status': 'pending', 'result': None})
+
+def submit_job(username):
+    if broker.pending_count('scrape') >= MAX_PENDING_JOBS:
+        raise AdmissionRejected('サーバーが混雑しています', admission.retry_after())
+
+    job_id = broker.submit('scrape', {'username': username})
+    print(f'[INFO] Enqueued job {job_id} for @{username}')
+    return job_id
+
+def job_response(job_id, job):
+    if job['status'] == 'done':
+        return json_response(job['result'])
+
+    if job['status'] == 'failed':
+        result = job['result'] or {}
+        return jsonify({
+            'error': result.get('error', '分析中にエラーが発生しました'),
+            'job_id': job_id
+        }), result.get('status_code', 500)
+
+    # フィールド指定はポーリング先に引き継ぎ、完了した結果に適用する
+    location = f'/jobs/{job_id}'
+    fields = request.args.get('fields')
+    if fields:
+        location += '?' + urlencode({'fields': fields})
+    return json_response({'job_id': job_id, 'status': job['status']}, 202, {'Location': location})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    分散モードのジョブ状態・結果を返す
+    """
+    if not broker:
+        return jsonify({'error': '分散モードが有効ではありません'}), 404
+
+    job = broker.get_result(job_id)
+    if not job:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    return job_response(job_id, job)
+
+def get_client_id():
+    """
+    公平なキューイングのためのクライアント識別子
+
+    クライアントが自由に設定できるヘッダーは信頼せず、信頼済みプロキシが
+    付与した値（X-Forwarded-For では右から TRUSTED_PROXY_HOPS 番目）のみ使用する
+    """
+    if TRUST_FLY_CLIENT_IP:
+        client_ip = request.headers.get('Fly-Client-IP', '').strip()
+        if client_ip:
+            return client_ip
+
+    if TRUSTED_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+
+    return request.remote_addr or 'unknown'
+
 def extract_username(url):
     """
     URLからユーザー名を抽出
@@ -106,15 +283,52 @@ def extract_username(url):
 
     return None
 
+@app.route('/admin/profile', methods=['GET'])
+def get_profile():
+    """
+    集計したスタックを返す（format=collapsed: flamegraph.pl/speedscope用, json: d3-flame-graph用, stats）
+    """
+    if not is_admin():
+        return jsonify({'error': '認証が必要です'}), 401
+
+    output_format = request.args.get('format', 'collapsed')
+    if output_format == 'json':
+        return jsonify(profiler.tree())
+    if output_format == 'stats':
+        return jsonify(profiler.stats())
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+@app.route('/admin/profile/reset', methods=['POST'])
+def reset_profile():
+    """
+    集計したスタックを破棄
+    """
+    if not is_admin():
+        return jsonify({'error': '認証が必要です'}), 401
+
+    profiler.reset()
+    return jsonify({'status': 'reset'})
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
     ヘルスチェック用エンドポイント
     """
+    if broker:
+        # 分散モードではAPIサーバーにChromeは不要
+        return jsonify({
+            'status': 'healthy',
+            'mode': 'distributed',
+            'analyzer': analyzer.is_ready(),
+            'admission': admission.stats(),
+            'pending_jobs': broker.pending_count('scrape')
+        })
+
     return jsonify({
         'status': 'healthy',
         'scraper': scraper.is_ready(),
-        'analyzer': analyzer.is_ready()
+        'analyzer': analyzer.is_ready(),
+        'admission': admission.stats()
     })
 
 if __name__ == '__main__':
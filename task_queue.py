@@ -0,0 +1,545 @@
+"""
+スクレイピング・分析タスクのワークキュー
+
+APIサーバーがタスクを登録し、ワーカープロセス（worker.py）が取得・実行して
+結果を書き戻します。ブローカーは差し替え可能です：
+
+- memory://             プロセス内（テスト・ローカル動作確認用）
+- sqlite:///tasks.db    単一ノード用
+- redis://host:6379/0   複数ノード用（Redis互換サーバー、redis パッケージが必要）
+
+タスクはリースを伴って取得され、ワーカーはハートビートでリースを延長します。
+リースが切れたタスクは再キューされ、max_attempts 回失敗すると失敗扱いになります。
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+# Redisクライアント（オプション）
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+DEFAULT_MAX_ATTEMPTS = 3
+RESULT_TTL = 3600
+
+
+class Broker:
+    """
+    ブローカーの共通インターフェース
+    """
+    max_attempts = DEFAULT_MAX_ATTEMPTS
+
+    def enqueue(self, kind, payload, job_id=None):
+        """
+        タスクを登録してタスクIDを返す（job_id 省略時はタスクIDと同じ）
+        """
+        raise NotImplementedError
+
+    def submit(self, kind, payload):
+        """
+        新しいジョブを登録してジョブIDを返す
+
+        ワーカーが結果を書き込んだ後に pending で上書きしないよう、
+        pending の結果を先に書き込んでからタスクを登録する
+        """
+        job_id = self._new_id()
+        self.set_result(job_id, 'pending')
+        self.enqueue(kind, payload, job_id=job_id)
+        return job_id
+
+    def pending_count(self, kind):
+        """
+        取得待ちのタスク数
+        """
+        raise NotImplementedError
+
+    def claim(self, kinds, worker_id, lease_seconds):
+        """
+        指定種別のタスクを1件取得。なければ None
+        戻り値: {'id', 'job_id', 'kind', 'payload', 'attempts'}
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, task_id, worker_id, lease_seconds):
+        """
+        リースを延長。リースを失っていれば False
+        """
+        raise NotImplementedError
+
+    def complete(self, task_id, worker_id):
+        raise NotImplementedError
+
+    def fail(self, task_id, worker_id, error):
+        """
+        タスクの失敗を記録。試行回数が残っていれば再キューし、なければジョブを失敗にする
+        """
+        raise NotImplementedError
+
+    def set_result(self, job_id, status, result=None):
+        raise NotImplementedError
+
+    def get_result(self, job_id):
+        """
+        ジョブの状態を返す: {'status', 'result'}。不明なジョブは None
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _new_id():
+        return uuid.uuid4().hex
+
+
+class MemoryBroker(Broker):
+    """
+    プロセス内ブローカー（テスト・ローカル動作確認用）
+    """
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.pending = []
+        self.results = {}
+
+    def enqueue(self, kind, payload, job_id=None):
+        task_id = self._new_id()
+        with self.lock:
+            self.tasks[task_id] = {
+                'id': task_id,
+                'job_id': job_id or task_id,
+                'kind': kind,
+                'payload': payload,
+                'attempts': 0,
+                'worker_id': None,
+                'lease_until': 0
+            }
+            self.pending.append(task_id)
+        return task_id
+
+    def claim(self, kinds, worker_id, lease_seconds):
+        with self.lock:
+            self._requeue_expired_locked()
+            # 期限切れの結果を削除
+            expired_before = time.time() - RESULT_TTL
+            for job_id in [job_id for job_id, entry in self.results.items() if entry['updated_at'] < expired_before]:
+                del self.results[job_id]
+            for task_id in self.pending:
+                task = self.tasks[task_id]
+                if task['kind'] in kinds:
+                    self.pending.remove(task_id)
+                    task['attempts'] += 1
+                    task['worker_id'] = worker_id
+                    task['lease_until'] = time.time() + lease_seconds
+                    return self._public(task)
+        return None
+
+    def pending_count(self, kind):
+        with self.lock:
+            return sum(1 for task_id in self.pending if self.tasks[task_id]['kind'] == kind)
+
+    def heartbeat(self, task_id, worker_id, lease_seconds):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task['worker_id'] != worker_id:
+                return False
+            task['lease_until'] = time.time() + lease_seconds
+            return True
+
+    def complete(self, task_id, worker_id):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task and task['worker_id'] == worker_id:
+                del self.tasks[task_id]
+
+    def fail(self, task_id, worker_id, error):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task and task['worker_id'] == worker_id:
+                self._retry_or_fail_locked(task, error)
+
+    def set_result(self, job_id, status, result=None):
+        with self.lock:
+            self._set_result_locked(job_id, status, result)
+
+    def get_result(self, job_id):
+        with self.lock:
+            entry = self.results.get(job_id)
+        if not entry or entry['updated_at'] < time.time() - RESULT_TTL:
+            return None
+        return {'status': entry['status'], 'result': entry['result']}
+
+    def _set_result_locked(self, job_id, status, result):
+        self.results[job_id] = {'status': status, 'result': result, 'updated_at': time.time()}
+
+    def _requeue_expired_locked(self):
+        now = time.time()
+        for task in list(self.tasks.values()):
+            if task['worker_id'] and task['lease_until'] < now:
+                self._retry_or_fail_locked(task, 'ワーカーの応答がありません（リース期限切れ）')
+
+    def _retry_or_fail_locked(self, task, error):
+        task['worker_id'] = None
+        if task['attempts'] < self.max_attempts:
+            self.pending.append(task['id'])
+        else:
+            del self.tasks[task['id']]
+            self._set_result_locked(task['job_id'], 'failed', {'error': error})
+
+    @staticmethod
+    def _public(task):
+        return {key: task[key] for key in ('id', 'job_id', 'kind', 'payload', 'attempts')}
+
+
+class SQLiteBroker(Broker):
+    """
+    SQLiteを使ったブローカー（単一ノード用、複数プロセスから共有可能）
+    """
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, kind, created_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_updated ON results (updated_at)')
+
+    def _connect(self):
+        # 自動コミットにして、必要な箇所だけ BEGIN IMMEDIATE で排他する
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _ClosingConnection(conn)
+
+    def enqueue(self, kind, payload, job_id=None):
+        with self._connect() as conn:
+            return self._insert_task(conn, kind, payload, job_id)
+
+    def submit(self, kind, payload):
+        job_id = self._new_id()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._set_result(conn, job_id, 'pending', None)
+                self._insert_task(conn, kind, payload, job_id)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return job_id
+
+    def pending_count(self, kind):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = 'pending' AND kind = ?", (kind,)
+            ).fetchone()
+        return row[0]
+
+    def _insert_task(self, conn, kind, payload, job_id):
+        task_id = self._new_id()
+        conn.execute(
+            'INSERT INTO tasks (id, job_id, kind, payload, created_at) VALUES (?, ?, ?, ?, ?)',
+            (task_id, job_id or task_id, kind, json.dumps(payload, ensure_ascii=False), time.time())
+        )
+        return task_id
+
+    def claim(self, kinds, worker_id, lease_seconds):
+        now = time.time()
+        placeholders = ','.join('?' * len(kinds))
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._requeue_expired(conn, now)
+                # 期限切れの結果を削除
+                conn.execute('DELETE FROM results WHERE updated_at < ?', (now - RESULT_TTL,))
+                row = conn.execute(
+                    f"SELECT * FROM tasks WHERE status = 'pending' AND kind IN ({placeholders}) "
+                    'ORDER BY created_at LIMIT 1',
+                    list(kinds)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE tasks SET status = 'running', attempts = attempts + 1, "
+                        'worker_id = ?, lease_until = ? WHERE id = ?',
+                        (worker_id, now + lease_seconds, row['id'])
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+        if not row:
+            return None
+        return {
+            'id': row['id'],
+            'job_id': row['job_id'],
+            'kind': row['kind'],
+            'payload': json.loads(row['payload']),
+            'attempts': row['attempts'] + 1
+        }
+
+    def heartbeat(self, task_id, worker_id, lease_seconds):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + lease_seconds, task_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM tasks WHERE id = ? AND worker_id = ?', (task_id, worker_id))
+
+    def fail(self, task_id, worker_id, error):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    "SELECT * FROM tasks WHERE id = ? AND worker_id = ? AND status = 'running'",
+                    (task_id, worker_id)
+                ).fetchone()
+                if row:
+                    self._retry_or_fail(conn, row, error)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def set_result(self, job_id, status, result=None):
+        with self._connect() as conn:
+            self._set_result(conn, job_id, status, result)
+
+    def get_result(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT status, result FROM results WHERE job_id = ? AND updated_at > ?',
+                (job_id, time.time() - RESULT_TTL)
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            'status': row['status'],
+            'result': json.loads(row['result']) if row['result'] else None
+        }
+
+    def _requeue_expired(self, conn, now):
+        rows = conn.execute(
+            "SELECT * FROM tasks WHERE status = 'running' AND lease_until < ?", (now,)
+        ).fetchall()
+        for row in rows:
+            self._retry_or_fail(conn, row, 'ワーカーの応答がありません（リース期限切れ）')
+
+    def _retry_or_fail(self, conn, row, error):
+        if row['attempts'] < self.max_attempts:
+            conn.execute(
+                "UPDATE tasks SET status = 'pending', worker_id = NULL, lease_until = 0 WHERE id = ?",
+                (row['id'],)
+            )
+        else:
+            conn.execute('DELETE FROM tasks WHERE id = ?', (row['id'],))
+            self._set_result(conn, row['job_id'], 'failed', {'error': error})
+
+    @staticmethod
+    def _set_result(conn, job_id, status, result):
+        conn.execute(
+            'INSERT OR REPLACE INTO results (job_id, status, result, updated_at) VALUES (?, ?, ?, ?)',
+            (job_id, status, json.dumps(result, ensure_ascii=False) if result is not None else None, time.time())
+        )
+
+
+class _ClosingConnection:
+    """
+    with 文の終了時にコネクションを閉じるラッパー
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+
+class RedisBroker(Broker):
+    """
+    Redis互換サーバーを使ったブローカー（複数ノード用）
+
+    取得・再キューは Lua スクリプトで原子的に行います。
+    """
+    # KEYS: queue key prefix, tasks hash prefix, leases zset
+    # ARGV: now, worker_id, lease_seconds, kinds...
+    CLAIM_SCRIPT = '''
+    local now = tonumber(ARGV[1])
+    for i = 4, #ARGV do
+        local task_id = redis.call('LPOP', KEYS[1] .. ARGV[i])
+        if task_id then
+            local key = KEYS[2] .. task_id
+            local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+            redis.call('HSET', key, 'worker_id', ARGV[2])
+            redis.call('ZADD', KEYS[3], now + tonumber(ARGV[3]), task_id)
+            return {task_id, attempts}
+        end
+    end
+    return nil
+    '''
+
+    # 期限切れのリースを取り除き、そのタスクIDを返す
+    EXPIRE_SCRIPT = '''
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+    for _, task_id in ipairs(expired) do
+        redis.call('ZREM', KEYS[1], task_id)
+    end
+    return expired
+    '''
+
+    def __init__(self, url, max_attempts=DEFAULT_MAX_ATTEMPTS, prefix='xbot:'):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError('Redisブローカーには redis パッケージが必要です（pip install redis）')
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.max_attempts = max_attempts
+        self.prefix = prefix
+        self.claim_script = self.client.register_script(self.CLAIM_SCRIPT)
+        self.expire_script = self.client.register_script(self.EXPIRE_SCRIPT)
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(parts)
+
+    def enqueue(self, kind, payload, job_id=None):
+        pipe = self.client.pipeline()
+        task_id = self._enqueue_in(pipe, kind, payload, job_id)
+        pipe.execute()
+        return task_id
+
+    def submit(self, kind, payload):
+        job_id = self._new_id()
+        # pending の結果とタスクを1つのトランザクションで登録
+        pipe = self.client.pipeline()
+        pipe.set(
+            self._key('result', job_id),
+            json.dumps({'status': 'pending', 'result': None}),
+            ex=RESULT_TTL
+        )
+        self._enqueue_in(pipe, kind, payload, job_id)
+        pipe.execute()
+        return job_id
+
+    def pending_count(self, kind):
+        return self.client.llen(self._key('queue', kind))
+
+    def _enqueue_in(self, pipe, kind, payload, job_id):
+        task_id = self._new_id()
+        pipe.hset(self._key('task', task_id), mapping={
+            'job_id': job_id or task_id,
+            'kind': kind,
+            'payload': json.dumps(payload, ensure_ascii=False),
+            'attempts': 0,
+            'worker_id': ''
+        })
+        pipe.rpush(self._key('queue', kind), task_id)
+        return task_id
+
+    def claim(self, kinds, worker_id, lease_seconds):
+        now = time.time()
+        for task_id in self.expire_script(keys=[self._key('leases')], args=[now]):
+            task = self.client.hgetall(self._key('task', task_id))
+            if task:
+                self._retry_or_fail(task_id, task, 'ワーカーの応答がありません（リース期限切れ）')
+
+        claimed = self.claim_script(
+            keys=[self._key('queue', ''), self._key('task', ''), self._key('leases')],
+            args=[now, worker_id, lease_seconds, *kinds]
+        )
+        if not claimed:
+            return None
+
+        task_id, attempts = claimed
+        task = self.client.hgetall(self._key('task', task_id))
+        return {
+            'id': task_id,
+            'job_id': task['job_id'],
+            'kind': task['kind'],
+            'payload': json.loads(task['payload']),
+            'attempts': int(attempts)
+        }
+
+    def heartbeat(self, task_id, worker_id, lease_seconds):
+        if self.client.hget(self._key('task', task_id), 'worker_id') != worker_id:
+            return False
+        # xx=True: 期限切れで既に取り除かれたリースは復活させない
+        return bool(self.client.zadd(
+            self._key('leases'), {task_id: time.time() + lease_seconds}, xx=True, ch=True
+        ))
+
+    def complete(self, task_id, worker_id):
+        if self.client.hget(self._key('task', task_id), 'worker_id') != worker_id:
+            return
+        pipe = self.client.pipeline()
+        pipe.zrem(self._key('leases'), task_id)
+        pipe.delete(self._key('task', task_id))
+        pipe.execute()
+
+    def fail(self, task_id, worker_id, error):
+        task = self.client.hgetall(self._key('task', task_id))
+        if task.get('worker_id') != worker_id:
+            return
+        # リースを取り除けたプロセスだけが再キューする
+        if self.client.zrem(self._key('leases'), task_id):
+            self._retry_or_fail(task_id, task, error)
+
+    def set_result(self, job_id, status, result=None):
+        self.client.set(
+            self._key('result', job_id),
+            json.dumps({'status': status, 'result': result}, ensure_ascii=False),
+            ex=RESULT_TTL
+        )
+
+    def get_result(self, job_id):
+        data = self.client.get(self._key('result', job_id))
+        return json.loads(data) if data else None
+
+    def _retry_or_fail(self, task_id, task, error):
+        if int(task.get('attempts', 0)) < self.max_attempts:
+            pipe = self.client.pipeline()
+            pipe.hset(self._key('task', task_id), 'worker_id', '')
+            pipe.rpush(self._key('queue', task['kind']), task_id)
+            pipe.execute()
+        else:
+            self.client.delete(self._key('task', task_id))
+            self.set_result(task['job_id'], 'failed', {'error': error})
+
+
+def create_broker(url, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    URLからブローカーを生成（memory:// は同一プロセス内でワーカーを動かす場合のみ有効）
+    """
+    if url.startswith('memory://'):
+        return MemoryBroker(max_attempts=max_attempts)
+    if url.startswith('sqlite:///'):
+        return SQLiteBroker(url[len('sqlite:///'):], max_attempts=max_attempts)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(url, max_attempts=max_attempts)
+    raise ValueError(f'サポートされていないブローカーURL: {url}')
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analyzer import BotAnalyzer
+from models import Tweet, AccountInfo
+from task_queue import MemoryBroker, SQLiteBroker
+from worker import Worker, TASK_SCRAPE, TASK_ANALYZE
+
+
+class FakeScraper:
+    def scrape_account(self, username):
+        return {
+            'account_info': AccountInfo('Test', username),
+            'tweets': [
+                Tweet(f'今日は{i}回目の投稿です！', f'2024-01-01T{i:02d}:00:00Z')
+                for i in range(10)
+            ]
+        }
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def broker(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBroker(max_attempts=2)
+    return SQLiteBroker(str(tmp_path / 'tasks.db'), max_attempts=2)
+
+
+def make_worker(broker):
+    return Worker(
+        broker, [TASK_SCRAPE, TASK_ANALYZE], lease_seconds=30,
+        scraper=FakeScraper(), analyzer=BotAnalyzer()
+    )
+
+
+def test_submit_is_pending_before_claim(broker):
+    job_id = broker.submit(TASK_SCRAPE, {'username': 'alice'})
+
+    assert broker.get_result(job_id) == {'status': 'pending', 'result': None}
+    assert broker.pending_count(TASK_SCRAPE) == 1
+
+
+def test_worker_completes_job(broker):
+    worker = make_worker(broker)
+    job_id = broker.submit(TASK_SCRAPE, {'username': 'alice'})
+
+    for _ in range(2):  # scrape -> analyze
+        task = broker.claim(worker.kinds, worker.worker_id, worker.lease_seconds)
+        assert task is not None
+        worker.process(task)
+
+    job = broker.get_result(job_id)
+    assert job['status'] == 'done'
+    assert job['result']['account']['username'] == 'alice'
+    assert 'overall_score' in job['result']['analysis']
+    assert broker.claim(worker.kinds, worker.worker_id, worker.lease_seconds) is None
+
+
+def test_expired_lease_fails_after_max_attempts(broker):
+    job_id = broker.submit(TASK_SCRAPE, {'username': 'alice'})
+
+    for attempt in (1, 2):
+        task = broker.claim([TASK_SCRAPE], f'dead-{attempt}', 0.01)
+        assert task['attempts'] == attempt
+        time.sleep(0.05)
+
+    assert broker.claim([TASK_SCRAPE], 'other', 30) is None
+    job = broker.get_result(job_id)
+    assert job['status'] == 'failed'
+    assert 'リース期限切れ' in job['result']['error']
+
+
+def test_fail_from_worker_that_lost_lease_is_ignored(broker):
+    job_id = broker.submit(TASK_SCRAPE, {'username': 'alice'})
+
+    stale = broker.claim([TASK_SCRAPE], 'stale', 0.01)
+    time.sleep(0.05)
+    current = broker.claim([TASK_SCRAPE], 'current', 30)
+    assert current['id'] == stale['id']
+
+    broker.fail(stale['id'], 'stale', 'late failure')
+
+    assert broker.heartbeat(current['id'], 'current', 30)
+    assert not broker.heartbeat(stale['id'], 'stale', 30)
+    assert broker.get_result(job_id)['status'] == 'pending'
+    assert broker.pending_count(TASK_SCRAPE) == 0
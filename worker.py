@@ -0,0 +1,146 @@
+"""
+スクレイピング・分析ワーカー
+
+ブローカーからタスクを取得して実行し、結果を書き戻します。
+スクレイピング用（Chromeが必要）と分析用のワーカーは別マシンで個別にスケールできます。
+
+使用例:
+    python worker.py --broker sqlite:///tasks.db
+    python worker.py --broker redis://localhost:6379/0 --kinds scrape
+    python worker.py --broker redis://localhost:6379/0 --kinds analyze
+"""
+import argparse
+import os
+import socket
+import threading
+import traceback
+import uuid
+
+from task_queue import create_broker
+from models import Tweet, AccountInfo
+
+TASK_SCRAPE = 'scrape'
+TASK_ANALYZE = 'analyze'
+
+
+class Worker:
+    def __init__(self, broker, kinds, lease_seconds=60, poll_interval=1.0, scraper=None, analyzer=None):
+        self.broker = broker
+        self.kinds = kinds
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.stopped = threading.Event()
+
+        # 必要なものだけ初期化（分析専用ワーカーにはChromeが不要）
+        self.scraper = scraper
+        self.analyzer = analyzer
+        if TASK_SCRAPE in kinds and self.scraper is None:
+            from scraper import TwitterScraper
+            self.scraper = TwitterScraper()
+        if TASK_ANALYZE in kinds and self.analyzer is None:
+            from analyzer import BotAnalyzer
+            self.analyzer = BotAnalyzer.from_env()
+
+    def run(self):
+        print(f'[WORKER] {self.worker_id} started (kinds: {", ".join(self.kinds)})')
+        while not self.stopped.is_set():
+            try:
+                task = self.broker.claim(self.kinds, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f'[WORKER] Broker error: {e}')
+                self.stopped.wait(self.poll_interval * 5)
+                continue
+
+            if not task:
+                self.stopped.wait(self.poll_interval)
+                continue
+
+            self.process(task)
+
+    def stop(self):
+        self.stopped.set()
+
+    def process(self, task):
+        print(f'[WORKER] Processing {task["kind"]} task {task["id"]} (attempt {task["attempts"]})')
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(task['id'], done), daemon=True)
+        heartbeat.start()
+
+        try:
+            if task['kind'] == TASK_SCRAPE:
+                self._handle_scrape(task)
+            elif task['kind'] == TASK_ANALYZE:
+                self._handle_analyze(task)
+            else:
+                raise ValueError(f'不明なタスク種別: {task["kind"]}')
+            self.broker.complete(task['id'], self.worker_id)
+        except Exception as e:
+            print(f'[WORKER] Task {task["id"]} failed: {e}')
+            traceback.print_exc()
+            self.broker.fail(task['id'], self.worker_id, f'分析中にエラーが発生しました: {str(e)}')
+        finally:
+            done.set()
+            heartbeat.join()
+
+    def _heartbeat(self, task_id, done):
+        # リース期間の1/3ごとに延長
+        while not done.wait(self.lease_seconds / 3):
+            try:
+                if not self.broker.heartbeat(task_id, self.worker_id, self.lease_seconds):
+                    print(f'[WORKER] Lost lease on task {task_id}')
+                    return
+            except Exception as e:
+                print(f'[WORKER] Heartbeat error: {e}')
+
+    def _handle_scrape(self, task):
+        username = task['payload']['username']
+        account_data = self.scraper.scrape_account(username)
+
+        if not account_data or not account_data.get('tweets'):
+            self.broker.set_result(task['job_id'], 'failed', {
+                'error': '投稿データを取得できませんでした。アカウントが存在しないか、非公開の可能性があります。',
+                'status_code': 404
+            })
+            return
+
+        print(f'[WORKER] Found {len(account_data["tweets"])} tweets for @{username}')
+        self.broker.enqueue(TASK_ANALYZE, {
+            'account_info': account_data['account_info'].to_dict(),
+            'tweets': [t.to_dict() for t in account_data['tweets']]
+        }, job_id=task['job_id'])
+
+    def _handle_analyze(self, task):
+        account_info = AccountInfo.from_dict(task['payload']['account_info'])
+        tweets = [Tweet.from_dict(t) for t in task['payload']['tweets']]
+        analysis_result = self.analyzer.analyze_tweets(tweets, account_info)
+
+        self.broker.set_result(task['job_id'], 'done', {
+            'account': account_info.to_dict(),
+            'tweets': [t.to_dict() for t in tweets[:10]],  # 最初の10件のみ返す
+            'analysis': analysis_result
+        })
+        print(f'[WORKER] Job {task["job_id"]} complete. Score: {analysis_result["overall_score"]}%')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='スクレイピング・分析ワーカー')
+    parser.add_argument('--broker', default=os.environ.get('TASK_BROKER_URL', 'sqlite:///tasks.db'),
+                        help='ブローカーURL（sqlite:///path, redis://host:port/db）')
+    parser.add_argument('--kinds', default=f'{TASK_SCRAPE},{TASK_ANALYZE}',
+                        help='処理するタスク種別（カンマ区切り）')
+    parser.add_argument('--lease', type=int, default=60, help='タスクのリース期間（秒）')
+    parser.add_argument('--max-attempts', type=int, default=3, help='タスクの最大試行回数')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='タスクがない時の待機間隔（秒）')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    broker = create_broker(args.broker, max_attempts=args.max_attempts)
+    worker = Worker(broker, kinds, lease_seconds=args.lease, poll_interval=args.poll_interval)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        print('[WORKER] Stopped')